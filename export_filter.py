@@ -33,6 +33,71 @@ except ImportError:
         print(f"[EXPORT-FILTER] ⚠️ Could not register export routes: {e}")
 
 
+# Patterns to detect export requests - more flexible patterns with typo tolerance.
+# Only used to build the compiled regexes below, which are what detection reads.
+EXPORT_PATTERNS = (
+    # PDF patterns - with typo tolerance for "export" (wxport, expotr, exprot, etc.)
+    r"[ewx]xport.*pdf",
+    r"exp[oar]rt.*pdf",
+    r"export.*pdf",
+    r"export.*to.*pdf",
+    r"export.*as.*pdf",
+    r"[ewx]xport.*to.*pdf",
+    r"[ewx]xport.*as.*pdf",
+    r"create.*pdf",
+    r"make.*pdf",
+    r"generate.*pdf",
+    r"save.*pdf",
+    r"download.*pdf",
+    r"give.*pdf",
+    r"pdf.*export",
+    r"pdf.*file",
+    r"pdf.*document",
+    r"convert.*pdf",
+    r"to\s+pdf",
+    r"as\s+pdf",
+    # Word/DOCX patterns - with typo tolerance
+    r"[ewx]xport.*word",
+    r"[ewx]xport.*docx",
+    r"exp[oar]rt.*word",
+    r"exp[oar]rt.*docx",
+    r"export.*word",
+    r"export.*docx",
+    r"export.*to.*word",
+    r"export.*to.*docx",
+    r"export.*as.*word",
+    r"export.*as.*docx",
+    r"[ewx]xport.*to.*word",
+    r"[ewx]xport.*to.*docx",
+    r"[ewx]xport.*as.*word",
+    r"[ewx]xport.*as.*docx",
+    r"create.*word",
+    r"create.*docx",
+    r"make.*word",
+    r"make.*docx",
+    r"generate.*word",
+    r"generate.*docx",
+    r"save.*word",
+    r"save.*docx",
+    r"download.*word",
+    r"download.*docx",
+    r"word.*export",
+    r"docx.*export",
+    r"word.*file",
+    r"docx.*file",
+    r"convert.*word",
+    r"convert.*docx",
+    r"to\s+word",
+    r"to\s+docx",
+    r"as\s+word",
+    r"as\s+docx",
+)
+# Compiled once at import. The per-pattern list keeps its order (the first matching pattern
+# decides the format); the fused alternation only answers "does anything match at all?"
+_EXPORT_PATTERN_RES = tuple(re.compile(p, re.IGNORECASE) for p in EXPORT_PATTERNS)
+_EXPORT_RE = re.compile("|".join(f"(?:{p})" for p in EXPORT_PATTERNS), re.IGNORECASE)
+
+
 class Filter:
     class Valves(BaseModel):
         priority: int = Field(default=10, description="Filter priority (higher = runs later)")
@@ -123,64 +188,6 @@ class Filter:
                 print(f"[EXPORT-FILTER] CRITICAL: Cannot create Valves - {e2}")
                 # This should never happen, but if it does, we're in trouble
                 raise
-        # Patterns to detect export requests - more flexible patterns with typo tolerance
-        self.export_patterns = [
-            # PDF patterns - with typo tolerance for "export" (wxport, expotr, exprot, etc.)
-            r"[ewx]xport.*pdf",
-            r"exp[oar]rt.*pdf",
-            r"export.*pdf",
-            r"export.*to.*pdf",
-            r"export.*as.*pdf",
-            r"[ewx]xport.*to.*pdf",
-            r"[ewx]xport.*as.*pdf",
-            r"create.*pdf",
-            r"make.*pdf",
-            r"generate.*pdf",
-            r"save.*pdf",
-            r"download.*pdf",
-            r"give.*pdf",
-            r"pdf.*export",
-            r"pdf.*file",
-            r"pdf.*document",
-            r"convert.*pdf",
-            r"to\s+pdf",
-            r"as\s+pdf",
-            # Word/DOCX patterns - with typo tolerance
-            r"[ewx]xport.*word",
-            r"[ewx]xport.*docx",
-            r"exp[oar]rt.*word",
-            r"exp[oar]rt.*docx",
-            r"export.*word",
-            r"export.*docx",
-            r"export.*to.*word",
-            r"export.*to.*docx",
-            r"export.*as.*word",
-            r"export.*as.*docx",
-            r"[ewx]xport.*to.*word",
-            r"[ewx]xport.*to.*docx",
-            r"[ewx]xport.*as.*word",
-            r"[ewx]xport.*as.*docx",
-            r"create.*word",
-            r"create.*docx",
-            r"make.*word",
-            r"make.*docx",
-            r"generate.*word",
-            r"generate.*docx",
-            r"save.*word",
-            r"save.*docx",
-            r"download.*word",
-            r"download.*docx",
-            r"word.*export",
-            r"docx.*export",
-            r"word.*file",
-            r"docx.*file",
-            r"convert.*word",
-            r"convert.*docx",
-            r"to\s+word",
-            r"to\s+docx",
-            r"as\s+word",
-            r"as\s+docx",
-        ]
 
     def _log(self, msg: str) -> None:
         if self.valves.debug:
@@ -190,11 +197,15 @@ class Filter:
         """Detect if user is requesting an export and return format (word/pdf)."""
         text_lower = text.lower()
         self._log(f"Checking text for export request: {text_lower[:100]}")
-        for pattern in self.export_patterns:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
+        # Most chat messages aren't export requests - one pass over the text rules them out
+        if not _EXPORT_RE.search(text_lower):
+            self._log("No export pattern matched")
+            return None
+        for pattern in _EXPORT_PATTERN_RES:
+            match = pattern.search(text_lower)
             if match:
                 matched = match.group(0)
-                self._log(f"Matched pattern: {pattern} -> {matched}")
+                self._log(f"Matched pattern: {pattern.pattern} -> {matched}")
                 if "word" in matched or "docx" in matched:
                     return "docx"
                 elif "pdf" in matched:
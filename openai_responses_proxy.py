@@ -2419,6 +2419,21 @@ async def download_export_file(file_id: str):
     )
 
 
+# SharePoint Filter shared by the browser endpoints, so its Graph session, token and
+# site/drive/listing caches carry over between requests (credentials are read from the
+# environment when sharepoint_import_filter is imported, so one instance serves them all)
+SHAREPOINT_FILTER = None
+
+
+def get_sharepoint_filter():
+    """Return the shared SharePoint Filter (created lazily)."""
+    global SHAREPOINT_FILTER
+    if SHAREPOINT_FILTER is None:
+        from sharepoint_import_filter import Filter
+        SHAREPOINT_FILTER = Filter()
+    return SHAREPOINT_FILTER
+
+
 # SharePoint Browser API Endpoints
 @app.get("/sharepoint-browser")
 async def sharepoint_browser_page_old():
@@ -2458,8 +2473,7 @@ async def list_sharepoint_files_api(folder: str = ""):
             )
         
         # Import the filter to use its methods
-        from sharepoint_import_filter import Filter
-        filter_instance = Filter()
+        filter_instance = get_sharepoint_filter()
         
         if not filter_instance.valves.enable_sharepoint:
             raise HTTPException(status_code=403, detail="SharePoint integration not enabled in filter")
@@ -2488,8 +2502,7 @@ async def list_sharepoint_files_api(folder: str = ""):
 async def search_sharepoint_files_api(q: str, folder: str = ""):
     """API endpoint to search SharePoint files within a folder."""
     try:
-        from sharepoint_import_filter import Filter
-        filter_instance = Filter()
+        filter_instance = get_sharepoint_filter()
         
         if not filter_instance.valves.enable_sharepoint:
             raise HTTPException(status_code=403, detail="SharePoint integration not enabled")
@@ -2519,8 +2532,7 @@ async def import_sharepoint_file_api(request: Request):
         if not file_id:
             raise HTTPException(status_code=400, detail="file_id is required")
         
-        from sharepoint_import_filter import Filter
-        filter_instance = Filter()
+        filter_instance = get_sharepoint_filter()
         
         if not filter_instance.valves.enable_sharepoint:
             raise HTTPException(status_code=403, detail="SharePoint integration not enabled")
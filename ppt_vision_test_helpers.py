@@ -0,0 +1,61 @@
+"""
+Shared helpers for the PPT/PDF vision test scripts
+(test_ppt_vision.py and test_ppt_vision_local.py).
+"""
+import io
+import json
+import re
+from collections import deque
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Known failure messages in the filter log - found in one pass over the text
+HINT_RE = re.compile(r"LibreOffice not found|No content extracted")
+
+
+def dumps(obj):
+    """Indented JSON for the report (orjson when available)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2, default=str)
+
+
+class LogRing(io.TextIOBase):
+    """stdout sink that keeps only the most recent max_chars of output, so long filter runs stay bounded."""
+    def __init__(self, max_chars=1_000_000):
+        self._dq = deque()
+        self._size = 0
+        self.max_chars = max_chars
+        self.dropped_writes = 0
+        self.dropped_chars = 0
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        n = len(s)
+        if n > self.max_chars:
+            # A single oversized write keeps only its tail
+            self.dropped_chars += n - self.max_chars
+            s = s[-self.max_chars:]
+        self._dq.append(s)
+        self._size += len(s)
+        while self._size > self.max_chars:
+            old = self._dq.popleft()
+            self._size -= len(old)
+            self.dropped_writes += 1
+            self.dropped_chars += len(old)
+        return n
+
+    def getvalue(self):
+        text = "".join(self._dq)
+        if self.dropped_chars:
+            return (
+                f"... ({self.dropped_writes} earlier writes dropped, "
+                f"{self.dropped_chars} chars total)\n" + text
+            )
+        return text
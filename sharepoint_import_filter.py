@@ -7,14 +7,30 @@ description: Import files from SharePoint for analysis in chat. Browse folders d
 
 import os
 import re
+import asyncio
 import base64
 import requests
+import shutil
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from operator import itemgetter
+from urllib.parse import quote, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 
+# Optional: faster JSON parsing for Graph responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # SharePoint Credentials - Read from environment variables (set in Render)
 # Do NOT hardcode secrets - GitHub will block the push
 SHAREPOINT_CLIENT_ID = os.environ.get("SHAREPOINT_CLIENT_ID", "")
@@ -22,8 +38,39 @@ SHAREPOINT_CLIENT_SECRET = os.environ.get("SHAREPOINT_CLIENT_SECRET", "")
 SHAREPOINT_TENANT_ID = os.environ.get("SHAREPOINT_TENANT_ID", "")
 SHAREPOINT_SITE_URL = os.environ.get("SHAREPOINT_SITE_URL", "https://glchemtecint.sharepoint.com/")
 
+# DriveItem fields used by _list_sharepoint_items - keeps Graph listing payloads small
+DRIVE_ITEM_SELECT = "id,name,size,webUrl,lastModifiedDateTime,folder,file,@microsoft.graph.downloadUrl"
+DRIVE_ITEM_QUERY = f"?$select={DRIVE_ITEM_SELECT}"
+# Largest page size Graph serves for driveItem children
+DRIVE_ITEM_PAGE_SIZE = 200
+# Items fetched for the browse list, "not found" hints and name fallback - one Graph page
+LISTING_HINT_LIMIT = 200
+# Where the proxy serves the SharePoint browser - relative, so it must be on the same domain
+BROWSER_PROXY_URL = "/sharepoint-browser"
+# Seconds a finished-late download waits for the user's next message in the same chat before it is discarded
+PENDING_DOWNLOAD_TTL = 30 * 60
+
 
 class Filter:
+    # SharePoint browser iframe injected by outlet - constant, so built once with the class
+    _BROWSER_HTML = f"""
+<div style="width: 100%; max-width: 100%; margin: 20px 0; border: 1px solid rgba(255,255,255,0.1); border-radius: 12px; overflow: hidden; background: #0f1419;">
+    <div style="padding: 15px; background: #1a1f2e; border-bottom: 1px solid rgba(255,255,255,0.1);">
+        <h3 style="margin: 0; color: #fff; font-size: 16px;">📂 SharePoint File Browser</h3>
+        <p style="margin: 5px 0 0 0; color: #94a3b8; font-size: 12px;">Browse and select files from SharePoint</p>
+    </div>
+    <iframe 
+        src="{BROWSER_PROXY_URL}" 
+        style="width: 100%; height: 600px; border: none; display: block;"
+        title="SharePoint File Browser"
+        allow="clipboard-read; clipboard-write"
+    ></iframe>
+</div>
+<p style="color: #94a3b8; font-size: 12px; margin-top: 10px;">
+    💡 <strong>Tip:</strong> Click on a file to select it, then click "Import Selected" to add it to your chat.
+</p>
+"""
+
     class Valves(BaseModel):
         priority: int = Field(default=5, description="Filter priority (runs before file processing)")
         enabled: bool = Field(default=True, description="Enable SharePoint import")
@@ -42,6 +89,10 @@ class Filter:
             default=True,
             description="Enable SharePoint integration"
         )
+        download_wait_seconds: float = Field(
+            default=2.0,
+            description="How long to wait for downloads before replying; slower files are attached to the user's next message in the same chat"
+        )
 
     def __init__(self):
         try:
@@ -56,8 +107,8 @@ class Filter:
                 enable_sharepoint=enable_sp
             )
             self._log("SharePoint import filter initialized (HARDCODED ENABLED)")
-            self._log(f"Site URL: {sharepoint_url}")
-            self._log(f"SharePoint enabled: {enable_sp}")
+            self._log("Site URL: %s", sharepoint_url)
+            self._log("SharePoint enabled: %s", enable_sp)
         except Exception as e:
             print(f"[SHAREPOINT-IMPORT] ERROR in __init__: {e}")
             import traceback
@@ -80,34 +131,133 @@ class Filter:
             r"list\s+sharepoint\s+files",
             r"browse\s+sharepoint",
         ]
+        # Compiled once: a single alternation scans the message in one pass
+        self._import_re = re.compile("|".join(f"(?:{p})" for p in self.import_patterns), re.IGNORECASE)
+        # Quoted names are tried before bare ones, so these stay two patterns
+        self._filename_quoted_re = re.compile(r'["\']([^"\']+\.(?:pdf|docx|pptx|xlsx|png|jpg|jpeg))["\']', re.IGNORECASE)
+        self._filename_bare_re = re.compile(r'(\w+\.(?:pdf|docx|pptx|xlsx|png|jpg|jpeg))', re.IGNORECASE)
+        self._browse_re = re.compile(
+            r"browse sharepoint|show sharepoint files|list sharepoint|sharepoint browser|open sharepoint|import from sharepoint",
+            re.IGNORECASE,
+        )
+
+        # One pooled session for all Graph/login calls - keeps TLS connections alive between requests.
+        # Retries also cover Graph throttling (429) and transient 5xx errors.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                respect_retry_after_header=True,
+                # Token requests and our read-only $batch calls are safe to retry
+                allowed_methods=frozenset({"GET", "POST"}),
+            ),
+        )
+        self._session.mount("https://", adapter)
+
+        # Graph access token cache: (token, monotonic expiry) - refreshed 60s before it expires
+        self._token_cache = None
+        self._token_lock = threading.Lock()
+
+        # site_url -> (site_id, drive_id, monotonic expiry); these IDs practically never change
+        self._site_cache: Dict[str, tuple] = {}
 
-    def _log(self, msg: str) -> None:
+        # Parsed sharepoint_site_url and the Graph paths built from it (see _site_refs)
+        self._parsed_site_url = None
+        self._site_host = ""
+        self._site_path = "/"
+        self._site_ref = ""
+        self._drives_ref = ""
+        self._site_refs()
+
+        # (drive_id, folder, include_folders, limit) -> (items, monotonic expiry); short TTL so new uploads show up quickly
+        self._listing_cache: Dict[tuple, tuple] = {}
+        self._listing_ttl = 45
+
+        # Upload directory doesn't change between downloads - resolved on the first download
+        self._upload_dir = None
+
+        # Bounded pool for concurrent Graph lookups (kept small to stay clear of Graph throttling)
+        self._executor = ThreadPoolExecutor(max_workers=4)
+        # Downloads get their own pool - long transfers must not starve the lookups of other requests
+        self._download_executor = ThreadPoolExecutor(max_workers=4)
+
+        # (user_id, chat_id) -> [(target_file, future, monotonic expiry)] for downloads still running when the reply went out
+        self._pending_downloads: Dict[tuple, List[tuple]] = {}
+        self._pending_lock = threading.Lock()
+
+    def __del__(self):
+        for name in ("_executor", "_download_executor"):
+            executor = getattr(self, name, None)
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _log(self, msg: str, *args: Any) -> None:
+        # %-style args are only formatted when debug output is on
         if self.valves.debug:
-            print(f"[SHAREPOINT-IMPORT] {msg}")
+            print(f"[SHAREPOINT-IMPORT] {msg % args if args else msg}")
+
+    def _loads(self, response) -> Any:
+        """Parse a JSON response body (orjson when available)."""
+        if ORJSON_AVAILABLE:
+            return orjson.loads(response.content)
+        return response.json()
 
     def _detect_import_request(self, text: str) -> bool:
         """Detect if user is requesting SharePoint file import."""
-        text_lower = text.lower()
-        for pattern in self.import_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return True
-        return False
+        # Every import pattern mentions "sharepoint" - a plain substring check rules out
+        # the vast majority of chat messages before any regex runs
+        if "sharepoint" not in text.lower():
+            return False
+        return self._import_re.search(text) is not None
 
     def _extract_filename_from_request(self, text: str) -> Optional[str]:
         """Extract filename from user request if specified."""
         # Look for patterns like "file.pdf", "document.docx", etc.
-        patterns = [
-            r'["\']([^"\']+\.(pdf|docx|pptx|xlsx|png|jpg|jpeg))["\']',
-            r'(\w+\.(pdf|docx|pptx|xlsx|png|jpg|jpeg))',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in (self._filename_quoted_re, self._filename_bare_re):
+            match = pattern.search(text)
             if match:
                 return match.group(1)
         return None
 
+    def _extract_filenames_from_request(self, text: str) -> List[str]:
+        """Extract every filename mentioned in the user request (quoted names take precedence)."""
+        names = []
+        quoted_spans = []
+        for match in self._filename_quoted_re.finditer(text):
+            names.append(match.group(1))
+            quoted_spans.append(match.span())
+        for match in self._filename_bare_re.finditer(text):
+            # Skip bare names that are part of a quoted name ("my report.pdf" -> not "report.pdf")
+            if not any(start <= match.start() < end for start, end in quoted_spans):
+                names.append(match.group(1))
+        
+        seen = set()
+        unique = []
+        for name in names:
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                unique.append(name)
+        return unique
+
     def _get_graph_token(self) -> Optional[str]:
-        """Get Microsoft Graph API access token using Azure AD credentials."""
+        """Get Microsoft Graph API access token using Azure AD credentials (cached until expiry)."""
+        cached = self._token_cache
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        
+        # Serialize refreshes so concurrent inlets don't all mint a new token
+        with self._token_lock:
+            cached = self._token_cache
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+            return self._fetch_graph_token()
+
+    def _fetch_graph_token(self) -> Optional[str]:
+        """Request a new Graph access token and store it in the token cache."""
         try:
             # Use hardcoded GLChemTec credentials, with env override if needed
             client_id = os.environ.get("SHAREPOINT_CLIENT_ID", SHAREPOINT_CLIENT_ID)
@@ -128,72 +278,145 @@ class Filter:
                 "scope": "https://graph.microsoft.com/.default"
             }
             
-            response = requests.post(token_url, data=token_data, timeout=10)
+            response = self._session.post(token_url, data=token_data, timeout=10)
             if response.status_code != 200:
-                self._log(f"Token request failed: {response.status_code} - {response.text[:200]}")
+                self._log("Token request failed: %s - %s", response.status_code, response.text[:200])
                 return None
             
-            token_resp = response.json()
-            return token_resp.get("access_token")
+            token_resp = self._loads(response)
+            access_token = token_resp.get("access_token")
+            if access_token:
+                # Client-credential tokens live ~1h; assume that if the response omits expires_in
+                expires_in = int(token_resp.get("expires_in", 3500))
+                self._token_cache = (access_token, time.monotonic() + expires_in - 60)
+            return access_token
             
         except Exception as e:
-            self._log(f"Error getting Graph API token: {e}")
+            self._log("Error getting Graph API token: %s", e)
             import traceback
-            self._log(f"Traceback: {traceback.format_exc()}")
+            self._log("Traceback: %s", traceback.format_exc())
             return None
 
-    def _get_site_and_drive_info(self) -> Optional[Dict[str, Any]]:
-        """Get SharePoint site ID and drive ID for API calls."""
+    def _site_refs(self) -> tuple:
+        """(site_ref, drives_ref) Graph paths for the configured site - built once, rebuilt only if the valve changes."""
+        site_url = self.valves.sharepoint_site_url
+        if site_url != self._parsed_site_url:
+            parts = urlsplit(site_url)
+            self._site_host = parts.netloc
+            self._site_path = parts.path or "/"
+            # Address the site by host/path so the drives request doesn't depend on the site ID -
+            # both can then go out in a single Graph $batch round trip
+            if self._site_path.strip("/"):
+                self._site_ref = f"/sites/{self._site_host}:{self._site_path}"
+                self._drives_ref = f"{self._site_ref}:/drives"
+            else:
+                self._site_ref = f"/sites/{self._site_host}"
+                self._drives_ref = f"{self._site_ref}/drives"
+            self._parsed_site_url = site_url
+        return self._site_ref, self._drives_ref
+
+    def _graph_batch(self, batch_requests: List[Dict[str, Any]], headers: Dict[str, str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Send independent GETs in one Graph $batch call. Returns responses keyed by request id."""
         try:
-            token = self._get_graph_token()
-            if not token:
-                return None
-            
-            site_url = self.valves.sharepoint_site_url
-            if not site_url:
-                self._log("SharePoint site URL not configured")
+            response = self._session.post(
+                "https://graph.microsoft.com/v1.0/$batch",
+                headers=headers,
+                json={"requests": batch_requests},
+                timeout=15,
+            )
+            if response.status_code != 200:
+                self._log("Batch request failed: %s", response.status_code)
                 return None
-            
-            # Extract site hostname and path
-            site_host = site_url.split("//")[1].split("/")[0] if "//" in site_url else ""
-            site_path = "/" + "/".join(site_url.split("//")[1].split("/")[1:]) if "//" in site_url else ""
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            # Get site by hostname and path
-            site_api_url = f"https://graph.microsoft.com/v1.0/sites/{site_host}:{site_path}"
-            site_response = requests.get(site_api_url, headers=headers, timeout=15)
+            return {r.get("id"): r for r in self._loads(response).get("responses", [])}
+        except Exception as e:
+            self._log("Batch request error: %s", e)
+            return None
+
+    def _resolve_site_and_drive(self) -> tuple:
+        """Resolve (site_id, drive_id) for the configured site, cached for an hour."""
+        site_url = self.valves.sharepoint_site_url
+        if not site_url:
+            self._log("SharePoint site URL not configured")
+            return None, None
+        
+        cached = self._site_cache.get(site_url)
+        if cached and time.monotonic() < cached[2]:
+            return cached[0], cached[1]
+        
+        token = self._get_graph_token()
+        if not token:
+            return None, None
+        
+        site_ref, drives_ref = self._site_refs()
+        
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json"
+        }
+        
+        batch = self._graph_batch(
+            [{"id": "site", "method": "GET", "url": site_ref},
+             {"id": "drives", "method": "GET", "url": drives_ref}],
+            headers,
+        )
+        if batch and batch.get("site", {}).get("status") == 200 and batch.get("drives", {}).get("status") == 200:
+            site_data = batch["site"].get("body") or {}
+            drives_data = batch["drives"].get("body") or {}
+        else:
+            # Fall back to sequential requests
+            site_api_url = f"https://graph.microsoft.com/v1.0{site_ref}"
+            site_response = self._session.get(site_api_url, headers=headers, timeout=15)
             
             if site_response.status_code != 200:
-                self._log(f"Failed to get site: {site_response.status_code}")
-                return None
-            
-            site_data = site_response.json()
-            site_id = site_data.get("id")
+                self._log("Failed to get site: %s", site_response.status_code)
+                return None, None
             
-            if not site_id:
+            site_data = self._loads(site_response)
+            if not site_data.get("id"):
                 self._log("Failed to get site ID")
-                return None
+                return None, None
             
-            # Get default document library (drive)
-            drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-            drives_response = requests.get(drives_url, headers=headers, timeout=15)
+            drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_data['id']}/drives"
+            drives_response = self._session.get(drives_url, headers=headers, timeout=15)
             
             if drives_response.status_code != 200:
-                self._log(f"Failed to get drives: {drives_response.status_code}")
-                return None
+                self._log("Failed to get drives: %s", drives_response.status_code)
+                return None, None
             
-            drives_data = drives_response.json()
-            drives = drives_data.get("value", [])
+            drives_data = self._loads(drives_response)
+        
+        site_id = site_data.get("id")
+        if not site_id:
+            self._log("Failed to get site ID")
+            return None, None
+        
+        # Default document library (drive)
+        drives = drives_data.get("value", [])
+        
+        if not drives:
+            self._log("No document libraries found")
+            return None, None
+        
+        drive_id = drives[0].get("id")
+        self._site_cache[site_url] = (site_id, drive_id, time.monotonic() + 3600)
+        return site_id, drive_id
+
+    def _get_site_and_drive_info(self) -> Optional[Dict[str, Any]]:
+        """Get SharePoint site ID and drive ID for API calls."""
+        try:
+            site_id, drive_id = self._resolve_site_and_drive()
+            if not drive_id:
+                return None
             
-            if not drives:
-                self._log("No document libraries found")
+            # Token comes from the token cache - headers are always built with the current one
+            token = self._get_graph_token()
+            if not token:
                 return None
             
-            drive_id = drives[0].get("id")
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json"
+            }
             
             return {
                 "token": token,
@@ -202,11 +425,64 @@ class Filter:
                 "headers": headers
             }
         except Exception as e:
-            self._log(f"Error getting site/drive info: {e}")
+            self._log("Error getting site/drive info: %s", e)
+            return None
+
+    def _item_to_dict(self, item: Dict[str, Any], drive_id: str, folder: str) -> Dict[str, Any]:
+        """Convert a Graph DriveItem into the filter's item format."""
+        name = item.get("name", "")
+        folder_meta = item.get("folder")
+        is_folder = folder_meta is not None
+        item_data = {
+            "id": item.get("id"),
+            "name": name,
+            "size": item.get("size", 0),
+            "download_url": item.get("@microsoft.graph.downloadUrl", ""),
+            "web_url": item.get("webUrl", ""),
+            "modified": item.get("lastModifiedDateTime", ""),
+            "is_folder": is_folder,
+            "drive_id": drive_id,
+            "path": f"{folder}/{name}" if folder else name
+        }
+        
+        if not is_folder:
+            item_data["mime_type"] = (item.get("file") or {}).get("mimeType", "")
+        else:
+            item_data["child_count"] = folder_meta.get("childCount", 0)
+        
+        return item_data
+
+    def _get_file_by_name(self, drive_id: str, folder: str, filename: str) -> Optional[Dict[str, Any]]:
+        """Look up a single file directly by path (no folder listing). Returns None if not found."""
+        try:
+            token = self._get_graph_token()
+            if not token or not drive_id:
+                return None
+            
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json"
+            }
+            folder = (folder or "").strip("/")
+            item_path = f"{folder}/{filename}" if folder else filename
+            item_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{quote(item_path)}?$select={DRIVE_ITEM_SELECT}"
+            
+            response = self._session.get(item_url, headers=headers, timeout=15)
+            if response.status_code != 200:
+                self._log("File lookup for '%s' returned %s", item_path, response.status_code)
+                return None
+            
+            item = self._loads(response)
+            if item.get("folder") is not None:
+                return None
+            return self._item_to_dict(item, drive_id, folder)
+        except Exception as e:
+            self._log("Error looking up SharePoint file '%s': %s", filename, e)
             return None
 
-    def _list_sharepoint_items(self, folder_path: str = None, include_folders: bool = True) -> List[Dict[str, Any]]:
-        """List files AND folders in SharePoint for navigation."""
+    def _list_sharepoint_items(self, folder_path: str = None, include_folders: bool = True, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List files AND folders in SharePoint for navigation. With a limit, stops paging once that many items are in."""
+        cache_key = None
         try:
             info = self._get_site_and_drive_info()
             if not info:
@@ -218,68 +494,86 @@ class Filter:
             # Build folder path - use provided path or default
             folder = folder_path.strip("/") if folder_path else ""
             
+            # Reuse a very recent listing (e.g. "not found" hint right after a lookup)
+            cache_key = (drive_id, folder, include_folders, limit)
+            cached = self._listing_cache.get(cache_key)
+            if cached and time.monotonic() < cached[1]:
+                return cached[0]
+            
             # Get items from drive root or specific folder path
             if folder:
-                # Use path-based access for nested folders
-                items_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{folder}:/children"
+                # Use path-based access for nested folders - Graph resolves the path server-side
+                items_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{quote(folder)}:/children"
             else:
                 items_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root/children"
+            # Only request the fields we use, and no bigger pages than the caller needs
+            page_size = min(limit, DRIVE_ITEM_PAGE_SIZE) if limit else DRIVE_ITEM_PAGE_SIZE
+            items_url += f"{DRIVE_ITEM_QUERY}&$top={page_size}"
+            
+            self._log("Listing items from: %s", items_url)
+            
+            items = []
+            while items_url:
+                files_response = self._session.get(items_url, headers=headers, timeout=15)
+                if files_response.status_code == 404 and folder:
+                    self._log("SharePoint folder '%s' not found", folder)
+                    return []
+                if files_response.status_code == 404:
+                    # The cached drive itself is gone - resolve it again on the next call
+                    self._site_cache.pop(self.valves.sharepoint_site_url, None)
+                if files_response.status_code != 200:
+                    self._log("Failed to list items: %s - %s", files_response.status_code, files_response.text[:200])
+                    return []
+                
+                files_data = self._loads(files_response)
+                items.extend(files_data.get("value", []))
+                items_url = files_data.get("@odata.nextLink")
+                if limit and len(items) >= limit:
+                    break
             
-            self._log(f"Listing items from: {items_url}")
-            
-            files_response = requests.get(items_url, headers=headers, timeout=15)
-            if files_response.status_code != 200:
-                self._log(f"Failed to list items: {files_response.status_code} - {files_response.text[:200]}")
-                return []
-            
-            files_data = files_response.json()
-            items = files_data.get("value", [])
-            
-            result = []
+            # Decorate with the sort key (folders first, then by name) while building each entry
+            decorated = []
             for item in items:
-                is_folder = item.get("folder") is not None
+                entry = self._item_to_dict(item, drive_id, folder)
+                is_folder = entry["is_folder"]
                 
                 # Skip folders if not requested
                 if is_folder and not include_folders:
                     continue
                 
-                item_data = {
-                    "id": item.get("id"),
-                    "name": item.get("name", ""),
-                    "size": item.get("size", 0),
-                    "download_url": item.get("@microsoft.graph.downloadUrl", ""),
-                    "web_url": item.get("webUrl", ""),
-                    "modified": item.get("lastModifiedDateTime", ""),
-                    "is_folder": is_folder,
-                    "drive_id": drive_id,
-                    "path": f"{folder}/{item.get('name', '')}" if folder else item.get("name", "")
-                }
-                
-                if not is_folder:
-                    item_data["mime_type"] = item.get("file", {}).get("mimeType", "") if item.get("file") else ""
-                else:
-                    item_data["child_count"] = item.get("folder", {}).get("childCount", 0)
-                
-                result.append(item_data)
+                decorated.append((0 if is_folder else 1, entry["name"].lower(), entry))
             
-            # Sort: folders first, then files
-            result.sort(key=lambda x: (0 if x.get("is_folder") else 1, x.get("name", "").lower()))
+            decorated.sort(key=itemgetter(0, 1))
+            result = [entry[2] for entry in decorated]
             
-            self._log(f"Found {len(result)} items in SharePoint folder '{folder or 'root'}'")
+            self._log("Found %d items in SharePoint folder '%s'", len(result), folder or "root")
+            self._listing_cache[cache_key] = (result, time.monotonic() + self._listing_ttl)
             return result
             
         except Exception as e:
-            self._log(f"Error listing SharePoint items: {e}")
+            self._log("Error listing SharePoint items: %s", e)
+            if cache_key is not None:
+                self._listing_cache.pop(cache_key, None)
             import traceback
-            self._log(f"Traceback: {traceback.format_exc()}")
+            self._log("Traceback: %s", traceback.format_exc())
             return []
 
-    def _list_sharepoint_files(self, folder_path: str = None) -> List[Dict[str, Any]]:
+    def _list_sharepoint_files(self, folder_path: str = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """List files in SharePoint using Microsoft Graph API (matching glc_assistant implementation)."""
-        # Use the new method but filter out folders for backward compatibility
-        items = self._list_sharepoint_items(folder_path, include_folders=False)
+        # Filter the (cached) full listing rather than fetching a files-only copy
+        items = self._list_sharepoint_items(folder_path, limit=limit)
         return [item for item in items if not item.get("is_folder")]
 
+    def _resolve_upload_dir(self) -> str:
+        """Pick the directory downloaded files are saved to."""
+        upload_dir = os.environ.get("UPLOAD_DIR", "/app/backend/data/uploads")
+        if not os.path.exists(upload_dir):
+            for alt_dir in ["/app/uploads", "/app/data/uploads", "/tmp"]:
+                if os.path.exists(alt_dir):
+                    return alt_dir
+            return tempfile.gettempdir()
+        return upload_dir
+
     def _download_sharepoint_file(self, file_id: str, drive_id: str, filename: str, download_url: str = None) -> Optional[str]:
         """Download file from SharePoint using Microsoft Graph API (matching glc_assistant implementation)."""
         try:
@@ -296,53 +590,165 @@ class Filter:
             if file_id and drive_id:
                 # Preferred: Use Graph API endpoint
                 graph_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{file_id}/content"
-                response = requests.get(graph_url, headers=headers, timeout=60, stream=True)
+                response = self._session.get(graph_url, headers=headers, timeout=(10, 300), stream=True)
             elif download_url:
                 # Fallback: Use direct download URL
-                response = requests.get(download_url, headers=headers, timeout=60, stream=True)
+                response = self._session.get(download_url, headers=headers, timeout=(10, 300), stream=True)
             else:
                 self._log("No file ID or download URL provided")
                 return None
             
             if response.status_code != 200:
-                self._log(f"Failed to download file: {response.status_code}")
+                self._log("Failed to download file: %s", response.status_code)
                 return None
             
-            # Save to uploads directory
-            upload_dir = os.environ.get("UPLOAD_DIR", "/app/backend/data/uploads")
-            if not os.path.exists(upload_dir):
-                for alt_dir in ["/app/uploads", "/app/data/uploads", "/tmp"]:
-                    if os.path.exists(alt_dir):
-                        upload_dir = alt_dir
-                        break
-                else:
-                    upload_dir = tempfile.gettempdir()
-            
             # Create unique filename to avoid conflicts
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_name = os.path.splitext(filename)[0]
-            ext = os.path.splitext(filename)[1]
+            base_name, ext = os.path.splitext(filename)
             local_filename = f"sharepoint_{base_name}_{timestamp}{ext}"
-            local_path = os.path.join(upload_dir, local_filename)
+            # Save to uploads directory
+            if self._upload_dir is None:
+                self._upload_dir = self._resolve_upload_dir()
+            local_path = os.path.join(self._upload_dir, local_filename)
             
-            # Download and save
+            # Download and save - copy in 1 MiB blocks without a Python-level chunk loop
+            response.raw.decode_content = True
             with open(local_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
             
             file_size = os.path.getsize(local_path)
-            self._log(f"Downloaded file from SharePoint: {local_filename} ({file_size} bytes)")
+            self._log("Downloaded file from SharePoint: %s (%d bytes)", local_filename, file_size)
             
             return local_path
             
         except Exception as e:
-            self._log(f"Error downloading SharePoint file: {e}")
+            self._log("Error downloading SharePoint file: %s", e)
             import traceback
-            self._log(f"Traceback: {traceback.format_exc()}")
+            self._log("Traceback: %s", traceback.format_exc())
             return None
 
-    def inlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
+    def _last_user_message(self, messages: List[dict]) -> Optional[dict]:
+        """Most recent user message, or None."""
+        for msg in reversed(messages):
+            if msg.get("role") == "user":
+                return msg
+        return None
+
+    def _extract_text(self, msg: dict) -> str:
+        """Get the plain text of a message (string content or the text parts of list content)."""
+        content = msg.get("content")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return " ".join(
+                item.get("text", "") for item in content
+                if isinstance(item, dict) and item.get("type") == "text"
+            )
+        return ""
+
+    def _append_instruction(self, msg: dict, text: str) -> None:
+        """Append an instruction note to a message, whatever its content format."""
+        content = msg.get("content")
+        if isinstance(content, list):
+            content.append({"type": "text", "text": text})
+        elif isinstance(content, str):
+            msg["content"] = content + text
+        else:
+            msg["content"] = [{"type": "text", "text": text}]
+
+    def _download_target(self, target_file: Dict[str, Any]) -> Optional[str]:
+        """Download one item as returned by _list_sharepoint_items."""
+        return self._download_sharepoint_file(
+            target_file.get("id", ""),
+            target_file.get("drive_id", ""),
+            target_file["name"],
+            target_file.get("download_url", ""),
+        )
+
+    def _attach_file(self, msg: dict, target_file: Dict[str, Any], local_path: str) -> None:
+        """Add a downloaded SharePoint file to the message for processing."""
+        if "files" not in msg:
+            msg["files"] = []
+        
+        file_obj = {
+            "file": {
+                "path": local_path,
+                "name": target_file["name"],
+                "size": target_file["size"],
+                "meta": {
+                    "path": local_path,
+                    "filename": target_file["name"],
+                    "source": "sharepoint"
+                }
+            }
+        }
+        msg["files"].append(file_obj)
+        self._log("Added SharePoint file to message: %s", target_file["name"])
+
+    def _discard_download(self, download) -> None:
+        """Done-callback for expired pending downloads - remove the file nobody will collect."""
+        try:
+            local_path = download.result()
+        except Exception:
+            return
+        if local_path:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+
+    def _expire_pending_downloads(self) -> None:
+        """Drop pending downloads whose chat never sent another message, deleting their files."""
+        now = time.monotonic()
+        expired = []
+        with self._pending_lock:
+            for key, pending in list(self._pending_downloads.items()):
+                live = [p for p in pending if p[2] > now]
+                expired.extend(p[1] for p in pending if p[2] <= now)
+                if live:
+                    self._pending_downloads[key] = live
+                else:
+                    del self._pending_downloads[key]
+        for download in expired:
+            # Runs immediately if already finished, otherwise once the transfer ends
+            download.add_done_callback(self._discard_download)
+
+    def _attach_pending_downloads(self, pending_key: tuple, msg: dict) -> None:
+        """Attach this chat's background downloads that have finished since the last message."""
+        with self._pending_lock:
+            pending = self._pending_downloads.get(pending_key)
+            if not pending:
+                return
+            # One done() check per entry - a download finishing mid-split must land in exactly one list
+            done, still_running = [], []
+            for entry in pending:
+                (done if entry[1].done() else still_running).append(entry)
+            if not done:
+                return
+            if still_running:
+                self._pending_downloads[pending_key] = still_running
+            else:
+                del self._pending_downloads[pending_key]
+        
+        instructions = []
+        for target_file, download, _ in done:
+            local_path = download.result()
+            if local_path:
+                self._attach_file(msg, target_file, local_path)
+                instructions.append(
+                    f"\n\n[SYSTEM NOTE: File '{target_file['name']}' requested earlier from SharePoint "
+                    f"has finished downloading and is attached for analysis.]"
+                )
+            else:
+                instructions.append(
+                    f"\n\n[SYSTEM NOTE: File '{target_file['name']}' requested earlier from SharePoint "
+                    f"could not be downloaded. Please inform the user.]"
+                )
+        self._append_instruction(msg, "".join(instructions))
+
+    async def inlet(
+        self, body: dict, __user__: Optional[dict] = None, __metadata__: Optional[dict] = None
+    ) -> dict:
         """
         Input filter - detects SharePoint import requests and downloads files.
         """
@@ -356,133 +762,118 @@ class Filter:
             return body
 
         # Check the last user message for SharePoint import requests
-        last_user_msg = None
-        for msg in reversed(messages):
-            if msg.get("role") == "user":
-                last_user_msg = msg
-                break
-
+        last_user_msg = self._last_user_message(messages)
         if not last_user_msg:
             return body
 
-        user_content = ""
-        if isinstance(last_user_msg.get("content"), str):
-            user_content = last_user_msg.get("content", "")
-        elif isinstance(last_user_msg.get("content"), list):
-            for item in last_user_msg.get("content", []):
-                if isinstance(item, dict) and item.get("type") == "text":
-                    user_content += item.get("text", "") + " "
+        # Late downloads belong to one user's chat - without both ids, downloads are waited for instead
+        user_id = (__user__ or {}).get("id") or ""
+        chat_id = (__metadata__ or body.get("metadata") or {}).get("chat_id") or ""
+        pending_key = (user_id, chat_id) if user_id and chat_id else None
+
+        # Hand over downloads that finished after the previous reply in this chat
+        if self._pending_downloads:
+            self._expire_pending_downloads()
+            if pending_key:
+                self._attach_pending_downloads(pending_key, last_user_msg)
+
+        user_content = self._extract_text(last_user_msg)
 
         if not self._detect_import_request(user_content):
             return body
 
-        self._log(f"SharePoint import request detected: {user_content[:100]}")
+        self._log("SharePoint import request detected: %s", user_content[:100])
+
+        # Graph calls and downloads block - run them in a worker thread so OpenWebUI's event loop stays free
+        await asyncio.to_thread(self._handle_import_request, last_user_msg, user_content, pending_key)
+        return body
 
+    def _handle_import_request(
+        self, last_user_msg: dict, user_content: str, pending_key: Optional[tuple] = None
+    ) -> None:
+        """List or download the requested SharePoint files and annotate the user message."""
         # Extract filename if specified
-        filename = self._extract_filename_from_request(user_content)
+        filenames = self._extract_filenames_from_request(user_content)
         
-        if filename:
-            # Download specific file
-            self._log(f"Downloading specific file: {filename}")
+        if filenames:
+            # Download specific file(s)
+            self._log("Downloading specific file(s): %s", ", ".join(filenames))
+            
+            # Look each file up directly by path - one Graph call per file instead of listing the folder
+            info = self._get_site_and_drive_info()
+            drive_id = info["drive_id"] if info else None
+            if drive_id:
+                found = list(self._executor.map(lambda name: self._get_file_by_name(drive_id, "", name), filenames))
+            else:
+                found = [None] * len(filenames)
+            targets = [f for f in found if f]
+            missing = [name for name, f in zip(filenames, found) if not f]
+            
+            # Start downloading what we already found while any listing fallback runs
+            downloads = [self._download_executor.submit(self._download_target, t) for t in targets]
+            
+            if missing:
+                # Fallback: match against the folder listing (also covers failed lookups)
+                files = self._list_sharepoint_files(limit=LISTING_HINT_LIMIT)
+                by_name = {f["name"].lower(): f for f in files}
+                still_missing = []
+                for filename in missing:
+                    target_file = by_name.get(filename.lower())
+                    if target_file:
+                        targets.append(target_file)
+                        downloads.append(self._download_executor.submit(self._download_target, target_file))
+                    else:
+                        still_missing.append(filename)
+                missing = still_missing
             
-            # List files to find the one matching
-            files = self._list_sharepoint_files()
-            target_file = None
+            instructions = []
             
-            # Also need to get drive ID for downloads
-            site_url = self.valves.sharepoint_site_url
-            if site_url:
+            # Don't hold the reply for slow downloads - those get attached on the user's next message
+            # in this chat. Without a user and chat to hand them to, wait for every download.
+            deadline = time.monotonic() + self.valves.download_wait_seconds
+            pending = []
+            for target_file, download in zip(targets, downloads):
                 try:
-                    token = self._get_graph_token()
-                    if token:
-                        site_host = site_url.split("//")[1].split("/")[0] if "//" in site_url else ""
-                        site_path = "/" + "/".join(site_url.split("//")[1].split("/")[1:]) if "//" in site_url else ""
-                        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-                        site_api_url = f"https://graph.microsoft.com/v1.0/sites/{site_host}:{site_path}"
-                        site_response = requests.get(site_api_url, headers=headers, timeout=15)
-                        if site_response.status_code == 200:
-                            site_data = site_response.json()
-                            site_id = site_data.get("id")
-                            if site_id:
-                                drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-                                drives_response = requests.get(drives_url, headers=headers, timeout=15)
-                                if drives_response.status_code == 200:
-                                    drives_data = drives_response.json()
-                                    drives = drives_data.get("value", [])
-                                    if drives:
-                                        drive_id = drives[0].get("id")
-                                        for f in files:
-                                            f["drive_id"] = drive_id
-                except Exception as e:
-                    self._log(f"Error getting drive ID: {e}")
-            
-            for f in files:
-                if f["name"].lower() == filename.lower():
-                    target_file = f
-                    break
-            
-            if target_file:
-                # Get drive ID from site (needed for Graph API download)
-                drive_id = target_file.get("drive_id", "")
-                file_id = target_file.get("id", "")
-                download_url = target_file.get("download_url", "")
-                
-                local_path = self._download_sharepoint_file(file_id, drive_id, target_file["name"], download_url)
+                    timeout = max(0.0, deadline - time.monotonic()) if pending_key else None
+                    local_path = download.result(timeout=timeout)
+                except FuturesTimeout:
+                    pending.append((target_file, download, time.monotonic() + PENDING_DOWNLOAD_TTL))
+                    instructions.append(
+                        f"\n\n[SYSTEM NOTE: File '{target_file['name']}' is still downloading from SharePoint. "
+                        f"Let the user know it will be attached to their next message.]"
+                    )
+                    continue
                 if local_path:
-                    # Add file to message for processing
-                    if "files" not in last_user_msg:
-                        last_user_msg["files"] = []
-                    
-                    file_obj = {
-                        "file": {
-                            "path": local_path,
-                            "name": target_file["name"],
-                            "size": target_file["size"],
-                            "meta": {
-                                "path": local_path,
-                                "filename": target_file["name"],
-                                "source": "sharepoint"
-                            }
-                        }
-                    }
-                    last_user_msg["files"].append(file_obj)
-                    self._log(f"Added SharePoint file to message: {target_file['name']}")
+                    self._attach_file(last_user_msg, target_file, local_path)
                     
                     # Add instruction to assistant
-                    instruction = (
+                    instructions.append(
                         f"\n\n[SYSTEM NOTE: User requested to import file '{target_file['name']}' from SharePoint. "
                         f"The file has been downloaded and is attached for analysis.]"
                     )
-                    
-                    if isinstance(last_user_msg.get("content"), str):
-                        last_user_msg["content"] = user_content + instruction
-                    elif isinstance(last_user_msg.get("content"), list):
-                        last_user_msg["content"].append({
-                            "type": "text",
-                            "text": instruction
-                        })
-            else:
+            if pending:
+                with self._pending_lock:
+                    self._pending_downloads.setdefault(pending_key, []).extend(pending)
+            
+            for filename in missing:
                 # File not found - list available files
-                self._log(f"File '{filename}' not found in SharePoint")
-                files = self._list_sharepoint_files()
+                self._log("File '%s' not found in SharePoint", filename)
+                files = self._list_sharepoint_files(limit=LISTING_HINT_LIMIT)
                 if files:
                     file_list = "\n".join([f"- {f['name']} ({f['size']//1024}KB)" for f in files[:10]])
-                    instruction = (
+                    instructions.append(
                         f"\n\n[SYSTEM NOTE: File '{filename}' not found in SharePoint. "
                         f"Available files:\n{file_list}\n"
                         f"Please ask the user which file they want to import.]"
                     )
-                    if isinstance(last_user_msg.get("content"), str):
-                        last_user_msg["content"] = user_content + instruction
-                    elif isinstance(last_user_msg.get("content"), list):
-                        last_user_msg["content"].append({
-                            "type": "text",
-                            "text": instruction
-                        })
+            
+            if instructions:
+                instruction = "".join(instructions)
+                self._append_instruction(last_user_msg, instruction)
         else:
             # List files for user to choose
             self._log("Listing SharePoint files for user selection")
-            files = self._list_sharepoint_files()
+            files = self._list_sharepoint_files(limit=LISTING_HINT_LIMIT)
             
             if files:
                 file_list = "\n".join([f"- {f['name']} ({f['size']//1024}KB)" for f in files[:20]])
@@ -491,27 +882,13 @@ class Filter:
                     f"Available files:\n{file_list}\n"
                     f"Please ask the user which file(s) they want to import for analysis.]"
                 )
-                if isinstance(last_user_msg.get("content"), str):
-                    last_user_msg["content"] = user_content + instruction
-                elif isinstance(last_user_msg.get("content"), list):
-                    last_user_msg["content"].append({
-                        "type": "text",
-                        "text": instruction
-                    })
+                self._append_instruction(last_user_msg, instruction)
             else:
                 instruction = (
                     f"\n\n[SYSTEM NOTE: No files found in SharePoint folder '{self.valves.sharepoint_folder}'. "
                     f"Please inform the user.]"
                 )
-                if isinstance(last_user_msg.get("content"), str):
-                    last_user_msg["content"] = user_content + instruction
-                elif isinstance(last_user_msg.get("content"), list):
-                    last_user_msg["content"].append({
-                        "type": "text",
-                        "text": instruction
-                    })
-
-        return body
+                self._append_instruction(last_user_msg, instruction)
 
     def stream(self, event: dict, __user__: Optional[dict] = None) -> dict:
         """
@@ -530,54 +907,23 @@ class Filter:
             return body
         
         # Check if user requested to browse SharePoint
-        last_user_msg = None
-        for msg in reversed(messages):
-            if msg.get("role") == "user":
-                last_user_msg = msg
-                break
-        
+        last_user_msg = self._last_user_message(messages)
         if not last_user_msg:
             return body
         
-        user_text = ""
-        if isinstance(last_user_msg.get("content"), str):
-            user_text = last_user_msg.get("content", "")
-        elif isinstance(last_user_msg.get("content"), list):
-            for item in last_user_msg.get("content", []):
-                if isinstance(item, dict) and item.get("type") == "text":
-                    user_text += item.get("text", "") + " "
+        user_text = self._extract_text(last_user_msg)
+        
+        # Every browse keyword mentions "sharepoint" - skip the regex work otherwise
+        if "sharepoint" not in user_text.lower():
+            return body
         
         # Check if user wants to browse (not download specific file)
-        browse_keywords = ["browse sharepoint", "show sharepoint files", "list sharepoint", "sharepoint browser", "open sharepoint", "import from sharepoint"]
-        wants_browse = any(keyword in user_text.lower() for keyword in browse_keywords)
+        wants_browse = self._browse_re.search(user_text) is not None
         
         # Only show browser if no specific file was requested
         has_specific_file = self._extract_filename_from_request(user_text) is not None
         
         if wants_browse and not has_specific_file:
-            # Get the proxy URL (where SharePoint browser is served)
-            # Use relative path - proxy should be on same domain
-            proxy_url = "/sharepoint-browser"
-            
-            # Create HTML iframe to embed SharePoint browser in chat
-            browser_html = f"""
-<div style="width: 100%; max-width: 100%; margin: 20px 0; border: 1px solid rgba(255,255,255,0.1); border-radius: 12px; overflow: hidden; background: #0f1419;">
-    <div style="padding: 15px; background: #1a1f2e; border-bottom: 1px solid rgba(255,255,255,0.1);">
-        <h3 style="margin: 0; color: #fff; font-size: 16px;">📂 SharePoint File Browser</h3>
-        <p style="margin: 5px 0 0 0; color: #94a3b8; font-size: 12px;">Browse and select files from SharePoint</p>
-    </div>
-    <iframe 
-        src="{proxy_url}" 
-        style="width: 100%; height: 600px; border: none; display: block;"
-        title="SharePoint File Browser"
-        allow="clipboard-read; clipboard-write"
-    ></iframe>
-</div>
-<p style="color: #94a3b8; font-size: 12px; margin-top: 10px;">
-    💡 <strong>Tip:</strong> Click on a file to select it, then click "Import Selected" to add it to your chat.
-</p>
-"""
-            
             # Find the last assistant message and inject the browser
             for msg in reversed(messages):
                 if msg.get("role") == "assistant":
@@ -587,15 +933,15 @@ class Filter:
                     if isinstance(content, str):
                         msg["content"] = [
                             {"type": "text", "text": content},
-                            {"type": "text", "text": browser_html}
+                            {"type": "text", "text": self._BROWSER_HTML}
                         ]
                     elif isinstance(content, list):
                         # Add browser HTML as text block
-                        msg["content"].append({"type": "text", "text": browser_html})
+                        msg["content"].append({"type": "text", "text": self._BROWSER_HTML})
                     else:
                         # Initialize as list
                         msg["content"] = [
-                            {"type": "text", "text": browser_html}
+                            {"type": "text", "text": self._BROWSER_HTML}
                         ]
                     
                     self._log("✅ Injected SharePoint browser iframe into chat response")
@@ -4,17 +4,57 @@ Test script to verify all filters can be loaded and serialized properly.
 This simulates what OpenWebUI does when listing functions.
 """
 
+import os
 import sys
+import io
+import importlib
+import threading
 import traceback
 import json
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# filter_name -> Filter class, so repeated runs skip the import machinery
+_IMPORT_CACHE = {}
+# Valves class -> JSON schema; schema generation is the expensive part of serialization
+_SCHEMA_CACHE = {}
+
+class _ThreadOutput:
+    """sys.stdout/sys.stderr stand-in that gives each worker thread its own buffer."""
+    def __init__(self, real, local=None):
+        self.real = real
+        # Pass another router's local to share its buffers (keeps stdout/stderr interleaved per worker)
+        self._local = local if local is not None else threading.local()
+    
+    def write(self, text):
+        return getattr(self._local, 'buffer', self.real).write(text)
+    
+    def flush(self):
+        self.real.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+    
+    def run(self, func, *args):
+        """Call func in the current thread, returning (result, captured output); False if it raised."""
+        self._local.buffer = io.StringIO()
+        try:
+            try:
+                result = func(*args)
+            except Exception:
+                traceback.print_exc(file=self._local.buffer)
+                result = False
+            return result, self._local.buffer.getvalue()
+        finally:
+            del self._local.buffer
 
 def test_filter_import(filter_name, filter_path):
     """Test importing a filter module."""
     try:
-        # Import the filter
-        spec = __import__(filter_name, fromlist=['Filter'])
-        Filter = getattr(spec, 'Filter')
+        # Import the filter (reusing an already-loaded module if there is one)
+        Filter = _IMPORT_CACHE.get(filter_name)
+        if Filter is None:
+            module = sys.modules.get(filter_name) or importlib.import_module(filter_name)
+            Filter = _IMPORT_CACHE[filter_name] = getattr(module, 'Filter')
         print(f"[OK] {filter_name}: Import successful")
         return Filter
     except Exception as e:
@@ -35,13 +75,16 @@ def test_filter_instantiation(Filter, filter_name):
 
 def test_filter_methods(instance, filter_name):
     """Test that filter has required methods."""
-    required_methods = ['inlet', 'outlet', 'stream']
+    required_methods = ('inlet', 'outlet', 'stream')
+    # One attribute lookup per method; the detailed breakdown is only built on failure
+    attrs = [getattr(instance, method, None) for method in required_methods]
     missing = []
-    for method in required_methods:
-        if not hasattr(instance, method):
-            missing.append(method)
-        elif not callable(getattr(instance, method)):
-            missing.append(f"{method} (not callable)")
+    if not all(map(callable, attrs)):
+        for method, attr in zip(required_methods, attrs):
+            if attr is None:
+                missing.append(method)
+            elif not callable(attr):
+                missing.append(f"{method} (not callable)")
     
     if missing:
         print(f"[FAIL] {filter_name}: Missing methods - {missing}")
@@ -60,7 +103,9 @@ def test_valves_serialization(instance, filter_name):
         print(f"[OK] {filter_name}: Valves.model_dump() successful")
         
         # Test model_json_schema (what OpenWebUI uses for UI)
-        schema = valves.model_json_schema()
+        schema = _SCHEMA_CACHE.get(type(valves))
+        if schema is None:
+            schema = _SCHEMA_CACHE[type(valves)] = valves.model_json_schema()
         print(f"[OK] {filter_name}: Valves.model_json_schema() successful")
         
         # Test JSON serialization
@@ -81,10 +126,10 @@ def test_filter_metadata(instance, filter_name):
             print(f"[FAIL] {filter_name}: No 'valves' attribute")
             return False
         
-        # Check if valves is a Pydantic model
-        from pydantic import BaseModel
-        if not isinstance(instance.valves, BaseModel):
-            print(f"[FAIL] {filter_name}: 'valves' is not a Pydantic model")
+        # Check valves exposes the Pydantic v2 API OpenWebUI calls
+        valves = instance.valves
+        if not (hasattr(valves, 'model_dump') and hasattr(valves, 'model_json_schema')):
+            print(f"[FAIL] {filter_name}: 'valves' is not a Pydantic v2 model")
             return False
         
         print(f"[OK] {filter_name}: Metadata check passed")
@@ -94,6 +139,40 @@ def test_filter_metadata(instance, filter_name):
         traceback.print_exc()
         return False
 
+def run_filter_tests(filter_name, filter_path):
+    """Run every check for one filter. Returns True if all of them passed."""
+    print(f"\n--- Testing {filter_name} ---")
+    
+    # Check file exists
+    if not os.path.isfile(filter_path):
+        print(f"[FAIL] {filter_name}: File not found - {filter_path}")
+        return False
+    
+    # Test import
+    Filter = test_filter_import(filter_name, filter_path)
+    if not Filter:
+        return False
+    
+    # Test instantiation
+    instance = test_filter_instantiation(Filter, filter_name)
+    if not instance:
+        return False
+    
+    # Test methods
+    if not test_filter_methods(instance, filter_name):
+        return False
+    
+    # Test metadata
+    if not test_filter_metadata(instance, filter_name):
+        return False
+    
+    # Test serialization (critical for OpenWebUI)
+    if not test_valves_serialization(instance, filter_name):
+        return False
+    
+    print(f"[OK] {filter_name}: ALL TESTS PASSED")
+    return True
+
 def main():
     """Test all filters."""
     filters_to_test = [
@@ -109,44 +188,20 @@ def main():
     print("Testing All Filters")
     print("=" * 60)
     
-    for filter_name, filter_path in filters_to_test:
-        print(f"\n--- Testing {filter_name} ---")
-        
-        # Check file exists
-        if not Path(filter_path).exists():
-            print(f"[FAIL] {filter_name}: File not found - {filter_path}")
-            results[filter_name] = False
-            continue
-        
-        # Test import
-        Filter = test_filter_import(filter_name, filter_path)
-        if not Filter:
-            results[filter_name] = False
-            continue
-        
-        # Test instantiation
-        instance = test_filter_instantiation(Filter, filter_name)
-        if not instance:
-            results[filter_name] = False
-            continue
-        
-        # Test methods
-        if not test_filter_methods(instance, filter_name):
-            results[filter_name] = False
-            continue
-        
-        # Test metadata
-        if not test_filter_metadata(instance, filter_name):
-            results[filter_name] = False
-            continue
-        
-        # Test serialization (critical for OpenWebUI)
-        if not test_valves_serialization(instance, filter_name):
-            results[filter_name] = False
-            continue
-        
-        results[filter_name] = True
-        print(f"[OK] {filter_name}: ALL TESTS PASSED")
+    # Filters are independent (imports, health checks) - test them concurrently and
+    # print each filter's buffered output in list order afterwards
+    router = _ThreadOutput(sys.stdout)
+    err_router = _ThreadOutput(sys.stderr, router._local)
+    sys.stdout, sys.stderr = router, err_router
+    try:
+        with ThreadPoolExecutor(max_workers=len(filters_to_test)) as executor:
+            outcomes = list(executor.map(lambda f: router.run(run_filter_tests, *f), filters_to_test))
+    finally:
+        sys.stdout, sys.stderr = router.real, err_router.real
+    
+    for (filter_name, _), (passed, output) in zip(filters_to_test, outcomes):
+        print(output, end="")
+        results[filter_name] = passed
     
     print("\n" + "=" * 60)
     print("Summary")
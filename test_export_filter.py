@@ -3,6 +3,7 @@
 
 import sys
 import os
+import py_compile
 
 print("=" * 60)
 print("Testing export_filter.py")
@@ -11,12 +12,11 @@ print("=" * 60)
 # Test 1: Syntax check
 print("\n[1/4] Testing syntax...")
 try:
-    with open('export_filter.py', 'r', encoding='utf-8') as f:
-        code = f.read()
-    compile(code, 'export_filter.py', 'exec')
+    # Writes the .pyc that the import in Test 3 then loads, so the source is only parsed once
+    py_compile.compile('export_filter.py', doraise=True)
     print("[OK] Syntax OK")
-except SyntaxError as e:
-    print(f"[ERROR] Syntax Error: {e}")
+except py_compile.PyCompileError as e:
+    print(f"[ERROR] Syntax Error: {e.msg}")
     sys.exit(1)
 except Exception as e:
     print(f"[ERROR] Error reading file: {e}")
@@ -95,6 +95,10 @@ for text, expected in test_cases:
     else:
         print(f"[WARN] '{text}' -> {result} (expected {expected})")
         all_passed = False
+    # The fused prefilter must agree with the ordered pattern list on whether anything matches
+    if (export_filter._EXPORT_RE.search(text.lower()) is None) != (result is None):
+        print(f"[WARN] '{text}' -> _EXPORT_RE disagrees with the pattern list")
+        all_passed = False
 
 if not all_passed:
     print("\n[WARN] Some detection tests failed, but filter should still work")
@@ -3,10 +3,14 @@ Test script for ppt_pdf_vision_filter.py
 Tests the filter with a real PPTX file and saves detailed output.
 """
 import os
+import io
 import json
 import sys
+from collections import Counter
 from datetime import datetime
+from pathlib import Path
 from ppt_pdf_vision_filter import Filter
+from ppt_vision_test_helpers import HINT_RE, LogRing, dumps
 
 # Test file path
 file_path = r"C:\APPLICATIONS MADE BY ME\WINDOWS\glchemtec_openwebui\test_files\GLCRCI-11062025R1 - Progress Update 05 - 11 Dec 2025 - rev 1.pptx"
@@ -14,11 +18,50 @@ file_path = r"C:\APPLICATIONS MADE BY ME\WINDOWS\glchemtec_openwebui\test_files\
 # Output file
 output_file = "test_output.txt"
 
+
+class _ReportFull(Exception):
+    """Raised by _CappedWriter once the report section is full."""
+
+class _CappedWriter(io.StringIO):
+    """StringIO that stops a streaming json.dump after limit characters."""
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def write(self, s):
+        room = self.limit - self.tell()
+        if len(s) > room:
+            super().write(s[:room])
+            raise _ReportFull
+        return super().write(s)
+
+
+def _redact(obj):
+    """Copy of obj with long base64 image payloads replaced by a size placeholder."""
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            if key == "url" and isinstance(value, str) and len(value) > 200 and value.startswith("data:"):
+                out[key] = f"<base64 {len(value)} bytes>"
+            else:
+                out[key] = _redact(value)
+        # Only the base64 source of an image block - other long "data" values stay readable
+        source = out.get("source") if obj.get("type") == "image" else None
+        if isinstance(source, dict) and source.get("type") == "base64":
+            data = source.get("data")
+            if isinstance(data, str) and len(data) > 200:
+                source["data"] = f"<base64 {len(data)} bytes>"
+        return out
+    if isinstance(obj, list):
+        return [_redact(item) for item in obj]
+    return obj
+
 def test_filter():
     """Run the filter and capture all output."""
     print(f"Testing PPT/PDF Vision Filter")
     print(f"File: {file_path}")
-    print(f"File exists: {os.path.exists(file_path)}")
+    file_exists = os.path.exists(file_path)
+    print(f"File exists: {file_exists}")
     print("=" * 80)
     
     # Create filter instance
@@ -46,17 +89,17 @@ def test_filter():
     print("\n=== RUNNING FILTER ===")
     
     # Capture stdout
-    import io
     from contextlib import redirect_stdout
     
-    stdout_capture = io.StringIO()
+    stdout_capture = LogRing()
     
     try:
         with redirect_stdout(stdout_capture):
             result = f.inlet(body)
         filter_output = stdout_capture.getvalue()
     except Exception as e:
-        filter_output = f"ERROR: {e}\n{traceback.format_exc()}"
+        import traceback
+        filter_output = f"ERROR: {e}\n" + "".join(traceback.TracebackException.from_exception(e).format())
         result = body
     
     print(filter_output)
@@ -68,7 +111,7 @@ def test_filter():
     analysis = {
         "timestamp": datetime.now().isoformat(),
         "input_file": file_path,
-        "file_exists": os.path.exists(file_path),
+        "file_exists": file_exists,
         "messages_count": len(messages),
         "last_message_role": messages[-1].get("role") if messages else None,
         "content_type": type(messages[-1].get("content")).__name__ if messages else None,
@@ -85,81 +128,84 @@ def test_filter():
         
         if isinstance(content, list):
             analysis["total_content_items"] = len(content)
-            for idx, item in enumerate(content):
+            blocks = [item for item in content if isinstance(item, dict)]
+            type_counts = Counter(item.get("type", "unknown") for item in blocks)
+            analysis["text_blocks"] = type_counts["text"]
+            analysis["image_url_blocks"] = type_counts["image_url"]
+            analysis["image_blocks"] = type_counts["image"]
+            # Preview only the first image block
+            first_image = next((item for item in blocks if item.get("type") in ("image_url", "image")), None)
+            if first_image is not None and first_image.get("type") == "image_url":
+                url = first_image.get("image_url", {}).get("url", "")
+                analysis["first_image_preview"] = {
+                    "length": len(url),
+                    "preview": url[:150] + ("..." if len(url) > 150 else ""),
+                    "is_data_url": url.startswith("data:image")
+                }
+            elif first_image is not None:
+                source = first_image.get("source", {})
+                data = source.get("data", "")
+                analysis["first_image_preview"] = {
+                    "length": len(data),
+                    "preview": data[:150] + ("..." if len(data) > 150 else ""),
+                    "media_type": source.get("media_type", "unknown")
+                }
+        elif isinstance(content, str):
+            analysis["content_is_string"] = True
+            analysis["content_length"] = len(content)
+    
+    # Save detailed output
+    # Build the report in memory and write it with a single call
+    parts = []
+    parts.append("=" * 80 + "\n")
+    parts.append("PPT/PDF VISION FILTER TEST OUTPUT\n")
+    parts.append("=" * 80 + "\n\n")
+    parts.append(f"Timestamp: {analysis['timestamp']}\n")
+    parts.append(f"Test File: {file_path}\n")
+    parts.append(f"File Exists: {analysis['file_exists']}\n\n")
+    
+    parts.append("=== FILTER LOGS ===\n")
+    parts.append(filter_output)
+    parts.append("\n\n")
+    
+    parts.append("=== ANALYSIS ===\n")
+    parts.append(dumps(analysis))
+    parts.append("\n\n")
+    
+    parts.append("=== RESULT MESSAGE CONTENT (first 2000 chars) ===\n")
+    if messages:
+        content = messages[-1].get("content", "")
+        if isinstance(content, list):
+            for idx, item in enumerate(content[:3]):  # First 3 items
+                parts.append(f"\n--- Content Item {idx} ---\n")
                 if isinstance(item, dict):
                     item_type = item.get("type", "unknown")
+                    parts.append(f"Type: {item_type}\n")
                     if item_type == "text":
-                        analysis["text_blocks"] += 1
+                        text = item.get("text", "")[:500]
+                        parts.append(f"Text preview: {text}...\n")
                     elif item_type == "image_url":
-                        analysis["image_url_blocks"] += 1
-                        if not analysis["first_image_preview"]:
-                            url = item.get("image_url", {}).get("url", "")
-                            analysis["first_image_preview"] = {
-                                "length": len(url),
-                                "preview": url[:150] + ("..." if len(url) > 150 else ""),
-                                "is_data_url": url.startswith("data:image")
-                            }
+                        url = item.get("image_url", {}).get("url", "")
+                        parts.append(f"URL length: {len(url)}\n")
+                        parts.append(f"URL preview: {url[:200]}...\n")
                     elif item_type == "image":
-                        analysis["image_blocks"] += 1
-                        if not analysis["first_image_preview"]:
-                            source = item.get("source", {})
-                            data = source.get("data", "")
-                            analysis["first_image_preview"] = {
-                                "length": len(data),
-                                "preview": data[:150] + ("..." if len(data) > 150 else ""),
-                                "media_type": source.get("media_type", "unknown")
-                            }
-        elif isinstance(content, str):
-            analysis["content_is_string"] = True
-            analysis["content_length"] = len(content)
+                        source = item.get("source", {})
+                        data = source.get("data", "")
+                        parts.append(f"Data length: {len(data)}\n")
+                        parts.append(f"Media type: {source.get('media_type', 'unknown')}\n")
+        else:
+            parts.append(str(content)[:2000])
     
-    # Save detailed output
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write("=" * 80 + "\n")
-        f.write("PPT/PDF VISION FILTER TEST OUTPUT\n")
-        f.write("=" * 80 + "\n\n")
-        f.write(f"Timestamp: {analysis['timestamp']}\n")
-        f.write(f"Test File: {file_path}\n")
-        f.write(f"File Exists: {analysis['file_exists']}\n\n")
-        
-        f.write("=== FILTER LOGS ===\n")
-        f.write(filter_output)
-        f.write("\n\n")
-        
-        f.write("=== ANALYSIS ===\n")
-        f.write(json.dumps(analysis, indent=2, default=str))
-        f.write("\n\n")
-        
-        f.write("=== RESULT MESSAGE CONTENT (first 2000 chars) ===\n")
-        if messages:
-            content = messages[-1].get("content", "")
-            if isinstance(content, list):
-                for idx, item in enumerate(content[:3]):  # First 3 items
-                    f.write(f"\n--- Content Item {idx} ---\n")
-                    if isinstance(item, dict):
-                        item_type = item.get("type", "unknown")
-                        f.write(f"Type: {item_type}\n")
-                        if item_type == "text":
-                            text = item.get("text", "")[:500]
-                            f.write(f"Text preview: {text}...\n")
-                        elif item_type == "image_url":
-                            url = item.get("image_url", {}).get("url", "")
-                            f.write(f"URL length: {len(url)}\n")
-                            f.write(f"URL preview: {url[:200]}...\n")
-                        elif item_type == "image":
-                            source = item.get("source", {})
-                            data = source.get("data", "")
-                            f.write(f"Data length: {len(data)}\n")
-                            f.write(f"Media type: {source.get('media_type', 'unknown')}\n")
-            else:
-                f.write(str(content)[:2000])
-        
-        f.write("\n\n=== FULL RESULT BODY (truncated) ===\n")
-        result_str = json.dumps(result, indent=2, default=str)
-        # Truncate very long base64 strings
-        if len(result_str) > 10000:
-            result_str = result_str[:10000] + "\n... (truncated - see individual items above)"
-        f.write(result_str)
+    parts.append("\n\n=== FULL RESULT BODY (truncated) ===\n")
+    # Image payloads are replaced before dumping, and encoding stops after 10000 chars
+    capped = _CappedWriter(10000)
+    try:
+        json.dump(_redact(result), capped, indent=2, default=str)
+        result_str = capped.getvalue()
+    except _ReportFull:
+        result_str = capped.getvalue() + "\n... (truncated - see individual items above)"
+    parts.append(result_str)
+    Path(output_file).write_text("".join(parts), encoding="utf-8")
     
     print("\n=== SUMMARY ===")
     print(f"Messages: {analysis['messages_count']}")
@@ -175,9 +221,10 @@ def test_filter():
             print(f"First image preview: {analysis['first_image_preview']}")
     else:
         print(f"\n[WARNING] No images were added. Check filter logs above.")
-        if "LibreOffice not found" in filter_output:
+        hints = set(HINT_RE.findall(filter_output))
+        if "LibreOffice not found" in hints:
             print("  -> LibreOffice is not installed or not in PATH")
-        if "No content extracted" in filter_output:
+        if "No content extracted" in hints:
             print("  -> Conversion failed - check LibreOffice installation")
     
     print(f"\n=== Full output saved to: {output_file} ===")
@@ -185,7 +232,6 @@ def test_filter():
 
 if __name__ == "__main__":
     try:
-        import traceback
         analysis = test_filter()
     except Exception as e:
         print(f"Test failed with error: {e}")
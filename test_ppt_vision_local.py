@@ -3,10 +3,11 @@ Local test script that can work with PDFs directly (skips PPT conversion)
 or tests the full pipeline if LibreOffice is available.
 """
 import os
-import json
 import sys
+from collections import Counter
 from datetime import datetime
 from ppt_pdf_vision_filter import Filter
+from ppt_vision_test_helpers import HINT_RE, LogRing, dumps
 
 # Test file - can be PPTX or PDF
 test_file = r"C:\APPLICATIONS MADE BY ME\WINDOWS\glchemtec_openwebui\test_files\GLCRCI-11062025R1 - Progress Update 05 - 11 Dec 2025 - rev 1.pptx"
@@ -15,18 +16,22 @@ test_file = r"C:\APPLICATIONS MADE BY ME\WINDOWS\glchemtec_openwebui\test_files\
 pdf_file = test_file.replace(".pptx", ".pdf").replace(".ppt", ".pdf")
 use_pdf_directly = os.path.exists(pdf_file)
 
+
 def test_filter():
     """Run the filter and capture all output."""
     print(f"Testing PPT/PDF Vision Filter (Local)")
     print(f"Original file: {test_file}")
-    print(f"File exists: {os.path.exists(test_file)}")
+    test_file_exists = os.path.exists(test_file)
+    print(f"File exists: {test_file_exists}")
     
     if use_pdf_directly:
         print(f"\n[INFO] Found PDF version - testing PDF->images directly (skips LibreOffice)")
         test_path = pdf_file
+        file_exists = True  # already checked when setting use_pdf_directly
     else:
         print(f"\n[INFO] Testing full pipeline: PPT->PDF->images (requires LibreOffice)")
         test_path = test_file
+        file_exists = test_file_exists
     
     print("=" * 80)
     
@@ -53,10 +58,9 @@ def test_filter():
     print("\n=== RUNNING FILTER ===")
     
     # Capture stdout
-    import io
     from contextlib import redirect_stdout
     
-    stdout_capture = io.StringIO()
+    stdout_capture = LogRing()
     
     try:
         with redirect_stdout(stdout_capture):
@@ -64,7 +68,7 @@ def test_filter():
         filter_output = stdout_capture.getvalue()
     except Exception as e:
         import traceback
-        filter_output = f"ERROR: {e}\n{traceback.format_exc()}"
+        filter_output = f"ERROR: {e}\n" + "".join(traceback.TracebackException.from_exception(e).format())
         result = body
     
     print(filter_output)
@@ -76,7 +80,7 @@ def test_filter():
     analysis = {
         "timestamp": datetime.now().isoformat(),
         "input_file": test_path,
-        "file_exists": os.path.exists(test_path),
+        "file_exists": file_exists,
         "messages_count": len(messages),
         "last_message_role": messages[-1].get("role") if messages else None,
         "content_type": type(messages[-1].get("content")).__name__ if messages else None,
@@ -93,22 +97,20 @@ def test_filter():
         
         if isinstance(content, list):
             analysis["total_content_items"] = len(content)
-            for idx, item in enumerate(content):
-                if isinstance(item, dict):
-                    item_type = item.get("type", "unknown")
-                    if item_type == "text":
-                        analysis["text_blocks"] += 1
-                    elif item_type == "image_url":
-                        analysis["image_url_blocks"] += 1
-                        if not analysis["first_image_preview"]:
-                            url = item.get("image_url", {}).get("url", "")
-                            analysis["first_image_preview"] = {
-                                "length": len(url),
-                                "preview": url[:150] + ("..." if len(url) > 150 else ""),
-                                "is_data_url": url.startswith("data:image")
-                            }
-                    elif item_type == "image":
-                        analysis["image_blocks"] += 1
+            blocks = [item for item in content if isinstance(item, dict)]
+            type_counts = Counter(item.get("type", "unknown") for item in blocks)
+            analysis["text_blocks"] = type_counts["text"]
+            analysis["image_url_blocks"] = type_counts["image_url"]
+            analysis["image_blocks"] = type_counts["image"]
+            # Preview only the first image_url block
+            first_image = next((item for item in blocks if item.get("type") == "image_url"), None)
+            if first_image is not None:
+                url = first_image.get("image_url", {}).get("url", "")
+                analysis["first_image_preview"] = {
+                    "length": len(url),
+                    "preview": url[:150] + ("..." if len(url) > 150 else ""),
+                    "is_data_url": url.startswith("data:image")
+                }
         elif isinstance(content, str):
             analysis["content_is_string"] = True
             analysis["content_length"] = len(content)
@@ -129,7 +131,7 @@ def test_filter():
         f.write("\n\n")
         
         f.write("=== ANALYSIS ===\n")
-        f.write(json.dumps(analysis, indent=2, default=str))
+        f.write(dumps(analysis))
         f.write("\n\n")
         
         if messages:
@@ -163,10 +165,11 @@ def test_filter():
             print(f"First image: {prev.get('length', 0)} chars, data URL: {prev.get('is_data_url', False)}")
     else:
         print(f"\n[WARNING] No images were added.")
-        if "LibreOffice not found" in filter_output:
+        hints = set(HINT_RE.findall(filter_output))
+        if "LibreOffice not found" in hints:
             print("  -> LibreOffice is not installed or not working")
             print("  -> TIP: Test with a PDF file directly to skip PPT conversion")
-        if "No content extracted" in filter_output:
+        if "No content extracted" in hints:
             print("  -> Conversion or image generation failed")
     
     print(f"\n=== Full output saved to: {output_file} ===")
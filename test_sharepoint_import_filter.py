@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Test script for sharepoint_import_filter.py - late-download handling with a mocked Graph."""
+
+import os
+import sys
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sharepoint_import_filter
+
+print("=" * 60)
+print("Testing sharepoint_import_filter.py late downloads")
+print("=" * 60)
+
+failures = []
+
+
+def check(label, ok):
+    print(f"[OK] {label}" if ok else f"[ERROR] {label}")
+    if not ok:
+        failures.append(label)
+
+
+# Filter with Graph lookups mocked out; downloads block until release is set
+upload_dir = tempfile.mkdtemp(prefix="sp_test_")
+release = threading.Event()
+
+
+def fake_download(target_file):
+    release.wait(10)
+    path = os.path.join(upload_dir, target_file["name"])
+    with open(path, "w") as f:
+        f.write("data")
+    return path
+
+
+f = sharepoint_import_filter.Filter()
+f.valves.debug = False
+f.valves.download_wait_seconds = 0.1
+f._download_target = fake_download
+f._get_site_and_drive_info = lambda: {"drive_id": "drive"}
+f._get_file_by_name = lambda drive_id, folder, name: {"name": name, "size": 4, "id": name}
+
+
+def body(text, chat_id):
+    return {"messages": [{"role": "user", "content": text}], "metadata": {"chat_id": chat_id}}
+
+
+def wait_done(key):
+    # Let the released downloads finish before the next inlet
+    for _, download, _ in f._pending_downloads.get(key, []):
+        download.result(timeout=10)
+
+
+user = {"id": "user-1"}
+
+# Test 1: a slow download is deferred to the chat it was requested in
+print("\n[1/3] Deferred download...")
+first = body("import from sharepoint: report1.pdf", "chat-1")
+asyncio.run(f.inlet(first, user))
+check("download queued under (user, chat)", list(f._pending_downloads) == [("user-1", "chat-1")])
+check("reply notes the file is still downloading", "still downloading" in first["messages"][0]["content"])
+check("no file attached yet", "files" not in first["messages"][0])
+
+# Test 2: the finished download is attached on the next message in that chat only
+print("\n[2/3] Attached on a later inlet...")
+release.set()
+wait_done(("user-1", "chat-1"))
+other_chat = body("thanks", "chat-2")
+asyncio.run(f.inlet(other_chat, user))
+check("other chat gets nothing", "files" not in other_chat["messages"][0])
+same_chat = body("thanks", "chat-1")
+asyncio.run(f.inlet(same_chat, user))
+files = same_chat["messages"][0].get("files", [])
+check("same chat gets the file", [x["file"]["name"] for x in files] == ["report1.pdf"])
+check("queue emptied", not f._pending_downloads)
+
+# Test 3: downloads whose chat never comes back expire and their files are removed
+print("\n[3/3] Expired after PENDING_DOWNLOAD_TTL...")
+release.clear()
+asyncio.run(f.inlet(body("import from sharepoint: report2.pdf", "chat-3"), user))
+key = ("user-1", "chat-3")
+check("download queued", key in f._pending_downloads)
+# Age the entry past its TTL instead of waiting it out
+downloads = [d for _, d, _ in f._pending_downloads[key]]
+f._pending_downloads[key] = [(t, d, time.monotonic() - 1) for t, d, _ in f._pending_downloads[key]]
+f._expire_pending_downloads()
+check("expired entry dropped", key not in f._pending_downloads)
+release.set()
+for download in downloads:
+    download.result(timeout=10)
+# Done-callbacks run right after the result is set, on the download thread
+expired_path = os.path.join(upload_dir, "report2.pdf")
+deadline = time.monotonic() + 10
+while os.path.exists(expired_path) and time.monotonic() < deadline:
+    time.sleep(0.01)
+check("expired download's file removed", not os.path.exists(expired_path))
+shutil.rmtree(upload_dir, ignore_errors=True)
+
+print("\n" + "=" * 60)
+if failures:
+    print(f"[FAIL] {len(failures)} check(s) failed")
+    print("=" * 60)
+    sys.exit(1)
+print("[OK] All tests passed!")
+print("=" * 60)
@@ -7,16 +7,17 @@ version: 3.0
 description: Forces high-detail vision mode and injects strict NMR OCR instructions for accurate spectrum analysis. Supports 1D/2D NMR for organic chemistry.
 """
 
+import re
 from pydantic import BaseModel, Field
-from typing import Optional, Any
+from typing import Optional, Any, Iterator
 
 
 NMR_STRICT_BLOCK = """
 [NMR STRICT MODE — MANDATORY FOR ALL SPECTRUM ANALYSIS]
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 PART 1: CRITICAL OCR RULES (ZERO TOLERANCE FOR ERRORS)
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 You are performing STRICT OCR on NMR spectrum peak labels.
 This is scientific data - errors have serious consequences.
@@ -39,9 +40,9 @@ FORBIDDEN ACTIONS:
 ❌ Dropping peaks that seem like noise
 ❌ Adding peaks you think should exist
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 PART 2: SPECTRUM TYPE IDENTIFICATION
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 FIRST, identify the spectrum type from axis labels and range:
 
@@ -62,9 +63,9 @@ FIRST, identify the spectrum type from axis labels and range:
 • NOESY/ROESY: Through-space correlations (< 5 Å)
 • TOCSY: Spin system identification
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 PART 3: OUTPUT FORMAT (MANDATORY)
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 FOR 1D ¹H NMR - ALWAYS USE THIS TABLE:
 | Peak# | δ (ppm) | Multiplicity | J (Hz) | Integration | Assignment |
@@ -89,9 +90,9 @@ FOR 2D NMR - LIST CORRELATIONS:
 | 7.45     | 128.5     | HSQC (direct)    | Ar-CH      |
 | 7.45     | 170.2     | HMBC (3-bond)    | H→C=O      |
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 PART 4: COMMON SOLVENTS & REFERENCES (EXCLUDE FROM COMPOUND DATA)
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 ALWAYS identify and EXCLUDE these from compound peak lists:
 
@@ -111,9 +112,9 @@ ALWAYS identify and EXCLUDE these from compound peak lists:
 • Acetone-d₆: δ 29.84 (septet), 206.26 (s)
 • C₆D₆: δ 128.06 (triplet)
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 PART 5: FINAL OUTPUT REQUIREMENTS
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 ALWAYS PROVIDE (in this order):
 
@@ -145,9 +146,9 @@ ALWAYS PROVIDE (in this order):
    - LOW: Poor image quality, many unreadable values
    - List specific limitations
 
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 MANDATORY SELF-AUDIT BEFORE SUBMITTING
-═══════════════════════════════════════════════════════════════
+----------------------------------------
 
 Before finalizing your response:
 □ Re-check EVERY δ value against the spectrum image
@@ -162,6 +163,19 @@ Accuracy is mandatory. When in doubt, say "UNREADABLE".
 [/NMR STRICT MODE]
 """.strip()
 
+# Opening tag of NMR_STRICT_BLOCK - a short needle for "already injected?" checks
+_NMR_SENTINEL = "[NMR STRICT MODE"
+# Block as prepended to plain-string user content
+_NMR_PREFIX = NMR_STRICT_BLOCK + "\n\n"
+# Block as inserted into list content (copied per injection - downstream code may mutate it)
+_NMR_TEXT_ITEM = {"type": "text", "text": NMR_STRICT_BLOCK}
+
+# Terms that trigger strict mode on their own whenever an image is present
+SPECIFIC_NMR_TERMS = (
+    "ppm", "13c", "1h", "nmr", "spectrum", "spectra",
+    "dept", "cosy", "hsqc", "hmbc", "noesy", "chemical shift",
+)
+
 
 class Filter:
     class Valves(BaseModel):
@@ -181,118 +195,99 @@ class Filter:
             default="nmr,1h,13c,19f,31p,11b,dept,dept-135,dept-90,apt,hsqc,hmbc,hmqc,cosy,noesy,roesy,tocsy,inadequate,ppm,cdcl3,dmso-d6,dmsod6,cd3od,d2o,c6d6,tms,spectrum,spectra,chemical shift,coupling,multiplet,singlet,doublet,triplet,quartet",
             description="Comma-separated keywords used to detect NMR intent.",
         )
+        debug: bool = Field(default=True, description="Enable debug logging")
 
     def __init__(self):
         self.valves = self.Valves()
+        # nmr_keywords + SPECIFIC_NMR_TERMS compiled into one alternation,
+        # rebuilt only when the valve changes (see _keyword_re)
+        self._kw_source = None
+        self._kw_re = None
         print("[VISION-NMR-STRICT] Filter v3.0 initialized - detail=high, comprehensive NMR support enabled")
 
     # -------------------------
     # Helpers
     # -------------------------
-    def _log(self, msg: str) -> None:
-        print(f"[VISION-NMR-STRICT] {msg}")
+    def _log(self, msg: str, *args: Any) -> None:
+        # %-style args are only formatted when debug output is on
+        if self.valves.debug:
+            print(f"[VISION-NMR-STRICT] {msg % args if args else msg}")
+
+    def _keyword_re(self) -> re.Pattern:
+        """Single regex matching any nmr_keywords valve entry or specific NMR term."""
+        raw = self.valves.nmr_keywords
+        if raw != self._kw_source:
+            keywords = [k.strip().lower() for k in raw.split(",") if k.strip()]
+            # dict.fromkeys drops terms listed in both while keeping their order
+            terms = dict.fromkeys(keywords + list(SPECIFIC_NMR_TERMS))
+            self._kw_re = re.compile("|".join(map(re.escape, terms)), re.IGNORECASE)
+            self._kw_source = raw
+        return self._kw_re
 
     def _is_image_item(self, item: Any) -> bool:
-        return isinstance(item, dict) and item.get("type") in (
-            "image_url",
-            "input_image",
-        )
+        # Content items are dicts in practice - let the rare odd item fail the lookup
+        # instead of type-checking every one
+        try:
+            return item.get("type") in ("image_url", "input_image")
+        except AttributeError:
+            return False
 
-    def _force_high_detail(self, item: dict) -> None:
+    def _force_high_detail(self, item: dict, detail: str) -> None:
         """Force high detail mode on image items for accurate OCR."""
         # Normalize common image payload shapes and set detail
         if "image_url" in item:
             img = item["image_url"]
             if isinstance(img, dict):
-                img["detail"] = self.valves.detail_mode
+                # Images already normalized by an earlier pass are left untouched
+                if img.get("detail") != detail:
+                    img["detail"] = detail
             elif isinstance(img, str):
-                item["image_url"] = {"url": img, "detail": self.valves.detail_mode}
+                item["image_url"] = {"url": img, "detail": detail}
             return
 
         if "url" in item and isinstance(item["url"], str):
-            url = item["url"]
-            item.pop("url", None)
-            item["image_url"] = {"url": url, "detail": self.valves.detail_mode}
-
-    def _extract_text_from_messages(self, messages: Any) -> str:
-        """Pull user-visible text to detect NMR intent."""
-        parts = []
-        if not isinstance(messages, list):
-            return ""
-
-        for msg in messages:
-            if not isinstance(msg, dict):
-                continue
-            content = msg.get("content")
-            if isinstance(content, str):
-                parts.append(content)
-            elif isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        t = item.get("text")
-                        if isinstance(t, str):
-                            parts.append(t)
-        return "\n".join(parts)
+            url = item.pop("url")
+            item["image_url"] = {"url": url, "detail": detail}
 
-    def _detect_nmr(self, body: dict) -> bool:
+    def _iter_text_parts(self, msg: dict) -> Iterator[str]:
+        """Yield the user-visible text parts of a message, used to detect NMR intent."""
+        content = msg.get("content")
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict) and item.get("type") == "text":
+                    t = item.get("text")
+                    if isinstance(t, str):
+                        yield t
+
+    def _detect_nmr(self, last_user_msg: Optional[dict], has_image: bool) -> bool:
         """
         Detect if the request is NMR-related.
         Returns True if NMR keywords found AND image present.
         """
-        messages = body.get("messages")
-        # CRITICAL: Only check LAST user message, not entire history
-        last_user_msg = None
-        if isinstance(messages, list):
-            for msg in reversed(messages):
-                if isinstance(msg, dict) and msg.get("role") == "user":
-                    last_user_msg = msg
-                    break
-
-        if not last_user_msg:
+        # Both activation rules need an image - text-only turns skip the keyword work entirely
+        if not has_image or not last_user_msg:
             return False
 
-        text = self._extract_text_from_messages([last_user_msg]).lower()
-        kw = [
-            k.strip().lower() for k in self.valves.nmr_keywords.split(",") if k.strip()
-        ]
-        keyword_hit = any(k in text for k in kw)
-
-        # Check if there's an image in the conversation
-        has_image = False
-        if isinstance(messages, list):
-            for msg in messages:
-                content = msg.get("content")
-                if isinstance(content, list):
-                    for item in content:
-                        if self._is_image_item(item):
-                            has_image = True
-                            break
-                if has_image:
-                    break
-
-        # NMR mode activates if: (keyword + image) OR (image + specific NMR terms)
-        specific_nmr_terms = ["ppm", "13c", "1h", "nmr", "spectrum", "spectra", 
-                             "dept", "cosy", "hsqc", "hmbc", "noesy", "chemical shift"]
-        has_specific_term = any(term in text for term in specific_nmr_terms)
-        
-        return bool(keyword_hit and has_image) or (has_image and has_specific_term)
-
-    def _inject_strict_block(self, body: dict) -> None:
+        # CRITICAL: Only check LAST user message, not entire history.
+        # Parts are searched one at a time (the pattern ignores case), so there is no
+        # joined or lowercased copy of the text and the first hit ends the scan.
+        # NMR mode activates if: (keyword + image) OR (image + specific NMR terms) -
+        # both term lists share one regex, so each part gets a single pass
+        keyword_re = self._keyword_re()
+        for part in self._iter_text_parts(last_user_msg):
+            if keyword_re.search(part):
+                return True
+        return False
+
+    def _inject_strict_block(self, body: dict, last_user_idx: Optional[int]) -> None:
         """
-        Inject NMR_STRICT_BLOCK into the last user message.
+        Inject NMR_STRICT_BLOCK into the last user message (found by inlet's message pass).
         Places instructions BEFORE the user's text for highest priority.
         """
-        messages = body.get("messages")
-        if not isinstance(messages, list) or not messages:
-            body["messages"] = [{"role": "system", "content": NMR_STRICT_BLOCK}]
-            return
-
-        # Find last user message
-        last_user_idx = None
-        for i in range(len(messages) - 1, -1, -1):
-            if isinstance(messages[i], dict) and messages[i].get("role") == "user":
-                last_user_idx = i
-                break
+        # inlet only gets here with a non-empty messages list
+        messages = body["messages"]
 
         if last_user_idx is None:
             # Prepend system instruction
@@ -304,8 +299,8 @@ class Filter:
 
         # If content is string, prepend block (instructions first!)
         if isinstance(content, str):
-            if "[NMR STRICT MODE" not in content:
-                msg["content"] = NMR_STRICT_BLOCK + "\n\n" + content
+            if _NMR_SENTINEL not in content:
+                msg["content"] = _NMR_PREFIX + content
             return
 
         # If content is list, add a text item at START (highest priority)
@@ -317,10 +312,10 @@ class Filter:
                     and item.get("type") == "text"
                     and isinstance(item.get("text"), str)
                 ):
-                    if "[NMR STRICT MODE" in item.get("text"):
+                    if _NMR_SENTINEL in item.get("text"):
                         return
             # Insert at beginning for highest priority
-            content.insert(0, {"type": "text", "text": NMR_STRICT_BLOCK})
+            content.insert(0, dict(_NMR_TEXT_ITEM))
             return
 
     # -------------------------
@@ -334,29 +329,39 @@ class Filter:
         """
         if not isinstance(body, dict):
             return body
+        # Nothing to rewrite or detect without a message list
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return body
 
         images_found = 0
         nmr_detected = False
+        last_user_idx = None
 
-        # 1) Force high detail on ALL image items (always, not just NMR)
-        messages = body.get("messages")
-        if isinstance(messages, list):
-            for msg in messages:
-                if not isinstance(msg, dict):
-                    continue
+        # 1) Force high detail on ALL image items (always, not just NMR), noting the
+        #    last user message in the same pass for detection and injection
+        detail = self.valves.detail_mode
+        for i, msg in enumerate(messages):
+            try:
+                role = msg.get("role")
                 content = msg.get("content")
-                if isinstance(content, list):
-                    for item in content:
-                        if self._is_image_item(item):
-                            self._force_high_detail(item)
-                            images_found += 1
+            except AttributeError:
+                continue  # not a message dict
+            if role == "user":
+                last_user_idx = i
+            if isinstance(content, list):
+                for item in content:
+                    if self._is_image_item(item):
+                        self._force_high_detail(item, detail)
+                        images_found += 1
 
         # 2) If NMR detected, inject strict NMR instruction block
-        if self.valves.enable_nmr_router and self._detect_nmr(body):
+        last_user_msg = messages[last_user_idx] if last_user_idx is not None else None
+        if self.valves.enable_nmr_router and self._detect_nmr(last_user_msg, images_found > 0):
             nmr_detected = True
-            self._inject_strict_block(body)
-            self._log(f"NMR STRICT MODE ACTIVATED - {images_found} image(s) with detail=high")
+            self._inject_strict_block(body, last_user_idx)
+            self._log("NMR STRICT MODE ACTIVATED - %d image(s) with detail=%s", images_found, detail)
         elif images_found > 0:
-            self._log(f"{images_found} image(s) set to detail={self.valves.detail_mode}")
+            self._log("%d image(s) set to detail=%s", images_found, detail)
 
         return body